@@ -1,7 +1,11 @@
 
 import os
-import io
+import asyncio
+import re
+import stat
 import zipfile
+from contextlib import ExitStack, asynccontextmanager
+from functools import partial
 from pathlib import Path
 from typing import List, Optional
 
@@ -10,17 +14,42 @@ from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from app.utils.generate import process_inputs_and_generate, GenerationError
+from app.utils.generate import process_inputs_and_generate, open_http_client, close_http_client, GenerationError, Source, OUTPUT_FILENAMES
 
-app = FastAPI(title="Metodický převodník – výběrová řízení")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    open_http_client()
+    try:
+        yield
+    finally:
+        await close_http_client()
+
+app = FastAPI(title="Metodický převodník – výběrová řízení", lifespan=lifespan)
 
 BASE = Path(__file__).resolve().parent
 OUTPUTS = BASE / "outputs"
 OUTPUTS.mkdir(exist_ok=True, parents=True)
+WORK_ID_RE = re.compile(r"[0-9a-f]{16}")
 
 app.mount("/static", StaticFiles(directory=str(BASE / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE / "templates"))
 
+def _has_content(fileobj) -> bool:
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size > 0
+
+def _open_zip(fileobj) -> Optional[zipfile.ZipFile]:
+    """Otevři ZIP přímo nad dočasným souborem uploadu (bez kopie do paměti); prázdný přeskoč."""
+    if not _has_content(fileobj):
+        return None
+    return zipfile.ZipFile(fileobj)
+
+def _zip_sources(zf: zipfile.ZipFile) -> list[Source]:
+    """Soubory ze ZIPu se čtou přímo z archivu, bez rozbalování na disk."""
+    return [(info.filename, partial(zf.open, info)) for info in zf.infolist() if not info.is_dir()]
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -38,31 +67,28 @@ async def upload(
         workdir = OUTPUTS / work_id
         workdir.mkdir(parents=True, exist_ok=True)
 
-        input_dir = workdir / "input"
-        input_dir.mkdir(parents=True, exist_ok=True)
-
-        if zipfile_input is not None and getattr(zipfile_input, "filename", ""):
-            data = await zipfile_input.read()
-            if data:
-                with zipfile.ZipFile(io.BytesIO(data)) as zf:
-                    zf.extractall(input_dir)
-
-        if files:
-            for f in files:
-                if not f or not getattr(f, "filename", ""):
-                    continue
-                content = await f.read()
-                if not content:
-                    continue
-                safe_name = Path(f.filename).name
-                (input_dir / safe_name).write_bytes(content)
-                
-        result = await process_inputs_and_generate(
-            input_dir=input_dir,
-            output_dir=workdir,
-            audience=audience,
-            style=style,
-        )
+        with ExitStack() as stack:
+            sources: list[Source] = []
+            if zipfile_input is not None and getattr(zipfile_input, "filename", ""):
+                zf = await asyncio.to_thread(_open_zip, zipfile_input.file)
+                if zf is not None:
+                    stack.enter_context(zf)
+                    sources.extend(_zip_sources(zf))
+
+            if files:
+                for f in files:
+                    if not f or not getattr(f, "filename", ""):
+                        continue
+                    if not await asyncio.to_thread(_has_content, f.file):
+                        continue
+                    sources.append((Path(f.filename).name, lambda f=f: f.file))
+
+            result = await process_inputs_and_generate(
+                sources=sources,
+                output_dir=workdir,
+                audience=audience,
+                style=style,
+            )
 
         return JSONResponse({
             "status": "ok",
@@ -78,7 +104,21 @@ async def upload(
 
 @app.get("/download/{work_id}/{fname}")
 async def download(work_id: str, fname: str):
+    # work_id je vždy os.urandom(8).hex() a soubor jen jeden z vygenerovaných výstupů;
+    # nic jiného (např. "..") nesmí projít do cesty
+    if not WORK_ID_RE.fullmatch(work_id) or fname not in OUTPUT_FILENAMES:
+        return JSONResponse({"status": "error", "detail": "File not found"}, status_code=404)
     path = OUTPUTS / work_id / fname
-    if not path.exists():
+    try:
+        st = path.stat()
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
         return JSONResponse({"status": "error", "detail": "File not found"}, status_code=404)
-    return FileResponse(str(path))
+    # work_id je pro každou úlohu jedinečné, obsah se tedy nemění; "private" –
+    # vygenerované dokumenty nesmí ukládat sdílené proxy/CDN
+    return FileResponse(
+        str(path),
+        stat_result=st,
+        headers={"Cache-Control": "private, max-age=86400, immutable"},
+    )
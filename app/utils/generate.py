@@ -1,57 +1,158 @@
-
+import asyncio
+import errno
+import hashlib
+import heapq
+import io
+import json
+import logging
 import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zipfile
+from contextlib import closing
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Optional
-
-from docx import Document as DocxDocument
-import pdfminer.high_level
+from typing import BinaryIO, Callable, Dict, Optional
 
-import asyncio
 import httpx
-import json
-import re
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+logger = logging.getLogger(__name__)
 
 META_PATTERNS = [
     r"^Použij.*formát", r"^Nepopisuj", r"^Vytvoř tabulku", r"^Uveď",
     r"^Text napiš", r"^Zdrojový text", r"^Vrať jen", r"^Vypiš"
 ]
+_META_RE = re.compile("|".join(f"(?:{p})" for p in META_PATTERNS), re.I)
 
 def _strip_meta(text: str) -> str:
     lines = text.splitlines()
-    cleaned = [l for l in lines if not any(re.search(p, l.strip(), flags=re.I) for p in META_PATTERNS)]
+    cleaned = [l for l in lines if not _META_RE.search(l.strip())]
     # když by náhodou zmizely všechny řádky, vrať původní
     return "\n".join(cleaned) if any(s.strip() for s in cleaned) else text
 
+# názvy výstupů v adresáři úlohy – /download nic jiného nevydá
+DOCX_FILENAME = "vystup_navod.docx"
+PNG_FILENAME = "schema.png"
+AUDIO_FILENAME = "shrnutí.mp3"
+OUTPUT_FILENAMES = frozenset({DOCX_FILENAME, PNG_FILENAME, AUDIO_FILENAME})
+
 USE_AZURE_SPEECH = bool(os.getenv("AZURE_SPEECH_KEY"))
 
 class GenerationError(Exception):
     pass
 
-def _read_text_from_path(p: Path) -> str:
+# Těžké knihovny (PyMuPDF, pdfminer, python-docx, lxml, Pillow) se importují až ve funkcích,
+# které je potřebují – start workeru je rychlejší a nečinný worker zabírá méně paměti.
+@lru_cache(maxsize=None)
+def _get_fitz():
+    import fitz  # PyMuPDF
+    return fitz
+
+def _read_pdf_text_pdfminer(fileobj: BinaryIO) -> str:
+    # laparams=None: bez rozboru rozvržení (sloupce, bloky), který je u pdfminer nejdražší;
+    # pro LLM stačí surový text. Konec řádku poznáme jen podle změny svislé souřadnice znaku.
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LTChar, LTContainer
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    rsrcmgr = PDFResourceManager(caching=True)
+    device = PDFPageAggregator(rsrcmgr, laparams=None)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    parts: list[str] = []
+    last_y = None
+
+    def walk(item):
+        nonlocal last_y
+        if isinstance(item, LTChar):
+            if last_y is not None and abs(item.y0 - last_y) > 1:
+                parts.append("\n")
+            parts.append(item.get_text())
+            last_y = item.y0
+        elif isinstance(item, LTContainer):
+            for child in item:
+                walk(child)
+
+    for page in PDFPage.get_pages(fileobj, caching=True):
+        interpreter.process_page(page)
+        walk(device.get_result())
+        parts.append("\n")
+        last_y = None
+    return "".join(parts)
+
+def _read_pdf_text(fileobj: BinaryIO) -> str:
+    data = fileobj.read()
+    # PyMuPDF je řádově rychlejší; pdfminer jen jako záloha při chybě
+    try:
+        with _get_fitz().open(stream=data, filetype="pdf") as doc:
+            return "\n".join(page.get_text("text") for page in doc)
+    except Exception:
+        return _read_pdf_text_pdfminer(io.BytesIO(data))
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_NS = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+
+def _read_docx_text(fileobj: BinaryIO) -> str:
+    # stačí text odstavců – čteme přímo word/document.xml bez objektového modelu python-docx
     try:
-        if p.suffix.lower() == ".docx":
-            d = DocxDocument(str(p))
-            return "\n".join([para.text for para in d.paragraphs])
-        if p.suffix.lower() == ".pdf":
-            return pdfminer.high_level.extract_text(str(p))
-        if p.suffix.lower() in [".txt", ".md"]:
-            return p.read_text(encoding="utf-8", errors="ignore")
+        from lxml import etree
+        paragraphs = []
+        with zipfile.ZipFile(fileobj) as z, z.open("word/document.xml") as f:
+            for _, el in etree.iterparse(f, tag=f"{_W_NS}p"):
+                # textová pole má Word dvakrát (mc:Choice a VML mc:Fallback) – bereme jen jednou
+                if next(el.iterancestors(f"{_MC_NS}Fallback"), None) is None:
+                    paragraphs.append("".join(t.text or "" for t in el.iter(f"{_W_NS}t")))
+                el.clear()
+        return "\n".join(paragraphs)
+    except Exception:
+        from docx import Document as DocxDocument
+        fileobj.seek(0)
+        d = DocxDocument(fileobj)
+        return "\n".join([para.text for para in d.paragraphs])
+
+# Vstupní soubor: (název, funkce vracející otevřený binární proud). Soubory se
+# neukládají na disk – čtou se přímo z nahraného souboru nebo ze ZIP archivu.
+Source = tuple[str, Callable[[], BinaryIO]]
+
+def _read_text(name: str, open_fn: Callable[[], BinaryIO]) -> str:
+    suffix = Path(name).suffix.lower()
+    if suffix not in (".docx", ".pdf", ".txt", ".md"):
         return ""
+    try:
+        with open_fn() as f:
+            if suffix == ".docx":
+                return _read_docx_text(f)
+            if suffix == ".pdf":
+                return _read_pdf_text(f)
+            return f.read().decode("utf-8", errors="ignore")
     except Exception:
         return ""
 
-def _collect_corpus(input_dir: Path) -> str:
-    texts = []
-    for p in input_dir.rglob("*"):
-        if p.is_file():
-            texts.append(_read_text_from_path(p))
-    corpus = "\n\n".join(t for t in texts if t.strip())
+CORPUS_LIMIT = 200_000
+
+async def _collect_corpus(sources: list[Source]) -> str:
+    files = sorted(sources, key=lambda s: s[0])
+    # parsování souborů je nezávislé – čte se po dávkách ve vláknech (dávka = počet jader)
+    # a skončí se, jakmile je dosažen limit znaků; zbytek by se stejně zahodil
+    batch = os.cpu_count() or 4
+    parts: list[str] = []
+    total = 0
+    for i in range(0, len(files), batch):
+        texts = await asyncio.gather(*(asyncio.to_thread(_read_text, name, open_fn) for name, open_fn in files[i:i + batch]))
+        for t in texts:
+            if not t.strip():
+                continue
+            parts.append(t)
+            total += len(t) + 2
+        if total >= CORPUS_LIMIT:
+            break
+    corpus = "\n\n".join(parts)
     if not corpus.strip():
         raise GenerationError("Nebyl nalezen žádný čitelný text (PDF/DOCX/TXT).")
-    return corpus[:200000]
+    return corpus[:CORPUS_LIMIT]
 
 def _build_prompt(corpus: str, audience: str, style: str, attachments: list[str]) -> str:
     return f"""
@@ -83,58 +184,121 @@ Zdrojový materiál (použij pro fakta, pojmy, role, lhůty a přílohy):
 {corpus}
 """
 
+SYSTEM_PROMPT = (
+    "Jsi český úřední asistent. Tvoje odpověď NESMÍ obsahovat popisy typu "
+    "‘vytvoř, vypiš, použij, v tomto dokumentu’. Rovnou napiš hotový obsah: "
+    "zejména konkrétní fáze, kroky, role, termíny a přílohy. "
+    "Piš stručně, úředně a srozumitelně, bez anglicismů."
+)
+LLM_TEMPERATURE = 0.1
+
+# Cache leží mimo strom app/ (odkud se servírují výstupy), aby nebyla dosažitelná přes /download.
+DATA_DIR = Path(os.getenv("DATA_DIR", str(Path.home() / ".cache" / "metodicky-prevodnik")))
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", str(DATA_DIR / "llm_cache.sqlite")))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+
+_cache_schema_ready = False
+_cache_schema_lock = threading.Lock()
+
+def _cache_db() -> sqlite3.Connection:
+    global _cache_schema_ready
+    if not _cache_schema_ready:
+        LLM_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(LLM_CACHE_PATH, timeout=5)
+    if not _cache_schema_ready:
+        with _cache_schema_lock:
+            if not _cache_schema_ready:
+                db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, text TEXT, expires REAL)")
+                db.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires)")
+                db.commit()
+                _cache_schema_ready = True
+    return db
+
+def _cache_get(key: str) -> Optional[str]:
+    try:
+        with closing(_cache_db()) as db:
+            row = db.execute("SELECT text, expires FROM llm_cache WHERE key = ?", (key,)).fetchone()
+    except (sqlite3.Error, OSError):
+        return None
+    if row and row[1] > time.time():
+        return row[0]
+    return None
+
+def _cache_set(key: str, text: str) -> None:
+    now = time.time()
+    try:
+        with closing(_cache_db()) as db, db:
+            # prošlé záznamy (celé odpovědi LLM) mažeme při zápisu, ať soubor neroste donekonečna
+            db.execute("DELETE FROM llm_cache WHERE expires < ?", (now,))
+            db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, text, now + LLM_CACHE_TTL))
+    except (sqlite3.Error, OSError):
+        pass
+
+# Sdílený klient – spojení (TLS, HTTP/2) se znovu využívá napříč požadavky.
+# Vzniká a zaniká v lifespan aplikace (open_http_client / close_http_client).
+_HTTP: Optional[httpx.AsyncClient] = None
+
+def open_http_client() -> None:
+    global _HTTP
+    _HTTP = httpx.AsyncClient(
+        timeout=60,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+
+async def close_http_client() -> None:
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
+async def _post_llm(url: str, headers: dict, payload: dict) -> str:
+    if _HTTP is not None:
+        r = await _HTTP.post(url, headers=headers, json=payload)
+    else:
+        # mimo lifespan (např. skript) – jednorázový klient
+        async with httpx.AsyncClient(timeout=60) as client:
+            r = await client.post(url, headers=headers, json=payload)
+    r.raise_for_status()
+    data = r.json()
+    return data["choices"][0]["message"]["content"]
+
 async def _call_llm(prompt: str) -> str:
     openai_key = os.getenv("OPENAI_API_KEY")
     azure_key = os.getenv("AZURE_OPENAI_KEY")
+    payload = {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": LLM_TEMPERATURE,
+        "top_p": 0.8,
+        "max_tokens": 3200,
+    }
     if azure_key and os.getenv("AZURE_OPENAI_ENDPOINT") and os.getenv("AZURE_OPENAI_DEPLOYMENT"):
         endpoint = os.getenv("AZURE_OPENAI_ENDPOINT").rstrip("/")
         deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
         url = f"{endpoint}/openai/deployments/{deployment}/chat/completions?api-version=2024-02-15-preview"
         headers = {"api-key": azure_key, "Content-Type": "application/json"}
-        payload = {
-            "messages": [
-                {"role": "system", "content": (
-                  "Jsi český úřední asistent. Tvoje odpověď NESMÍ obsahovat popisy typu "
-                  "‘vytvoř, vypiš, použij, v tomto dokumentu’. Rovnou napiš hotový obsah: "
-                  "zejména konkrétní fáze, kroky, role, termíny a přílohy. "
-                  "Piš stručně, úředně a srozumitelně, bez anglicismů."
-                )},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,
-            "top_p": 0.8,
-            "max_tokens": 3200,
-        }
-        async with httpx.AsyncClient(timeout=60) as client:
-            r = await client.post(url, headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
-            return data["choices"][0]["message"]["content"]
+        model = f"azure:{deployment}"
     elif openai_key:
+        url = "https://api.openai.com/v1/chat/completions"
         headers = {"Authorization": f"Bearer {openai_key}", "Content-Type": "application/json"}
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {"role": "system", "content": (
-                  "Jsi český úřední asistent. Tvoje odpověď NESMÍ obsahovat popisy typu "
-                  "‘vytvoř, vypiš, použij, v tomto dokumentu’. Rovnou napiš hotový obsah: "
-                  "zejména konkrétní fáze, kroky, role, termíny a přílohy. "
-                  "Piš stručně, úředně a srozumitelně, bez anglicismů."
-                )},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,
-            "top_p": 0.8,
-            "max_tokens": 3200,
-        }
-        async with httpx.AsyncClient(timeout=60) as client:
-            r = await client.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
-            return data["choices"][0]["message"]["content"]
+        model = "gpt-4o-mini"
+        payload["model"] = model
     else:
         return "POZNÁMKA: LLM není nakonfigurováno. Uveďte API klíče. Náhled shrnutí:\n\n" + prompt[:1500]
 
+    # stejný korpus + zadání → stejná odpověď (teplota je téměř nulová)
+    key = hashlib.sha256("\x00".join([SYSTEM_PROMPT, prompt, model, str(LLM_TEMPERATURE)]).encode()).hexdigest()
+    cached = await asyncio.to_thread(_cache_get, key)
+    if cached is not None:
+        return cached
+
+    text = await _post_llm(url, headers, payload)
+    await asyncio.to_thread(_cache_set, key, text)
+    return text
+
 def _make_docx(text: str, out_path: Path):
     from docx import Document
     from docx.shared import Pt
@@ -151,38 +315,126 @@ def _make_docx(text: str, out_path: Path):
     title.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
     for line in text.splitlines():
-        if line.strip().startswith("# "):
-            doc.add_heading(line.strip("# ").strip(), level=1)
-        elif line.strip().startswith("## "):
-            doc.add_heading(line.strip("# ").strip(), level=2)
+        s = line.strip()
+        if s.startswith("# "):
+            doc.add_heading(s.strip("# ").strip(), level=1)
+        elif s.startswith("## "):
+            doc.add_heading(s.strip("# ").strip(), level=2)
         else:
             doc.add_paragraph(line)
     doc.save(out_path)
 
-def _make_png_from_phases(output_dir: Path, phases: list[str]) -> str:
-    png_path = output_dir / "schema.png"
-    import matplotlib.pyplot as plt
-    import matplotlib.patches as patches
+# přibalená DejaVu Sans má českou diakritiku na každém hostiteli (i bez systémových písem)
+FONT_PATH = Path(__file__).resolve().parent.parent / "static" / "fonts" / "DejaVuSans.ttf"
+
+@lru_cache(maxsize=None)
+def _font_source() -> Optional[str]:
+    """Cesta k použitému TrueType písmu; None = vestavěné písmo Pillow."""
+    from PIL import ImageFont
+    for name in (str(FONT_PATH), "DejaVuSans.ttf", "Arial.ttf", "arial.ttf"):
+        try:
+            return ImageFont.truetype(name, 10).path
+        except OSError:
+            continue
+    # vestavěné písmo Pillow nemá české znaky (vykreslí místo nich prázdné obdélníky)
+    logger.warning("Písmo %s nenalezeno, schéma se vykreslí bez české diakritiky.", FONT_PATH)
+    return None
+
+def _load_font(size: int):
+    from PIL import ImageFont
+    source = _font_source()
+    return ImageFont.truetype(source, size) if source else ImageFont.load_default(size=size)
+
+def _wrap_text(d, text: str, font, max_width: int) -> list[str]:
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and d.textlength(candidate, font=font) > max_width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return (lines + [line]) if line else lines or [""]
+
+PNG_CACHE_DIR = Path(os.getenv("PNG_CACHE_DIR", str(DATA_DIR / "png_cache")))
+PNG_CACHE_MAX = int(os.getenv("PNG_CACHE_MAX", "500"))
+# zvyš při každé změně vzhledu schématu (_render_phases_png, písmo), jinak cache vrací stará schémata
+PNG_RENDER_VERSION = "1"
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copyfile(src, dst)  # jiný svazek, hard link nejde
+
+def _prune_png_cache() -> None:
+    # ponech jen PNG_CACHE_MAX naposledy použitých schémat (mtime se obnovuje při zásahu)
+    entries = sorted(os.scandir(PNG_CACHE_DIR), key=lambda e: e.stat().st_mtime, reverse=True)
+    for e in entries[PNG_CACHE_MAX:]:
+        try:
+            os.unlink(e.path)
+        except OSError:
+            pass
 
+def _make_png_from_phases(output_dir: Path, phases: list[str]) -> str:
+    png_path = output_dir / PNG_FILENAME
     steps = phases[:14] if phases else ["Fáze 1", "Fáze 2"]
-    fig, ax = plt.subplots(figsize=(9, max(6, 1.1*len(steps))))
-    ax.axis('off')
-    W, H = 0.82, 0.07; x = 0.09
-    ys = [0.92 - i*0.08 for i in range(len(steps))]
-    for i, (y, text) in enumerate(zip(ys, steps)):
-        rect = patches.FancyBboxPatch((x, y), W, H,
-                                      boxstyle="round,pad=0.02,rounding_size=0.02",
-                                      linewidth=1, edgecolor="black", facecolor="white")
-        ax.add_patch(rect)
-        ax.text(x + W/2, y + H/2, text, ha='center', va='center',
-                wrap=True, fontsize=10)
-        if i < len(ys)-1:
-            ax.annotate("", xy=(x+W/2, y),
-                        xytext=(x+W/2, ys[i+1]+H),
-                        arrowprops=dict(arrowstyle="->", lw=1))
-    fig.savefig(png_path, dpi=200, bbox_inches="tight")
+
+    # stejné fáze → stejné schéma; z cache se soubor jen pevně propojí (nic se nekopíruje).
+    # Jakákoli chyba cache jen znamená, že se schéma vykreslí znovu.
+    # klíč: verze vykreslování + skutečně použité písmo + fáze (JSON – "|" v názvu fáze nevadí)
+    key_src = json.dumps([PNG_RENDER_VERSION, _font_source(), steps], ensure_ascii=False)
+    key = hashlib.blake2b(key_src.encode(), digest_size=16).hexdigest()
+    cached = PNG_CACHE_DIR / f"{key}.png"
+    try:
+        _link_or_copy(cached, png_path)
+        os.utime(cached)
+        return str(png_path)
+    except OSError:
+        png_path.unlink(missing_ok=True)
+
+    _render_phases_png(steps, png_path)
+    try:
+        PNG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _link_or_copy(png_path, cached)
+        _prune_png_cache()
+    except OSError:
+        pass
     return str(png_path)
 
+def _render_phases_png(steps: list[str], png_path: Path) -> None:
+    from PIL import Image, ImageDraw
+
+    width, margin, gap, pad = 1800, 160, 90, 28
+    box_w = width - 2 * margin
+    font = _load_font(40)
+    line_h = 52
+
+    measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    wrapped = [_wrap_text(measure, t, font, box_w - 2 * pad) for t in steps]
+    heights = [max(120, len(ls) * line_h + 2 * pad) for ls in wrapped]
+    height = 2 * margin + sum(heights) + gap * (len(steps) - 1)
+
+    img = Image.new("RGB", (width, height), "white")
+    d = ImageDraw.Draw(img)
+    cx = width // 2
+    y = margin
+    for i, (lines, h) in enumerate(zip(wrapped, heights)):
+        d.rounded_rectangle((margin, y, margin + box_w, y + h), radius=20, outline="black", width=3)
+        ty = y + (h - len(lines) * line_h) // 2
+        for ln in lines:
+            d.text((cx, ty + line_h // 2), ln, fill="black", font=font, anchor="mm")
+            ty += line_h
+        y += h
+        if i < len(steps) - 1:
+            tip = y + gap - 6
+            d.line((cx, y + 6, cx, tip - 18), fill="black", width=3)
+            d.polygon([(cx - 14, tip - 22), (cx + 14, tip - 22), (cx, tip)], fill="black")
+            y += gap
+    img.save(png_path, optimize=True)
+
 def _make_tts(text: str, out_path: Path) -> Optional[str]:
     if not USE_AZURE_SPEECH:
         return None
@@ -198,17 +450,21 @@ def _make_tts(text: str, out_path: Path) -> Optional[str]:
     except Exception:
         return None
         
-def _list_attachments(input_dir: Path) -> list[str]:
+ATTACHMENTS_LIMIT = 300  # bezpečnostní limit
+
+def _list_attachments(sources: list[Source]) -> list[str]:
      """Vrať jen názvy souborů (bez cest), aby je LLM mohlo mapovat k přílohám."""
-     out = []
-     for p in input_dir.rglob("*"):
-         if p.is_file():
-             out.append(p.name)
-     return sorted(out)[:300]  # bezpečnostní limit
+     # názvy ze ZIPu mají vždy oddělovač "/"; nsmallest drží jen prvních N (bez řazení všeho)
+     return heapq.nsmallest(ATTACHMENTS_LIMIT, (name.rsplit("/", 1)[-1] for name, _ in sources))
+
+_JSON_RE = re.compile(r"```json\s*(\{.*?\})\s*```", re.S)
+_PHASE_HDR = re.compile(r"^##\s+Přehled fází.*?$", re.I | re.M)
+_BULLET = re.compile(r"^\s*[-*]\s*(.+)$", re.M)
+_TRAIL = re.compile(r"\s*[–-]\s*.*$")
 
 def _extract_phases_from_json_block(text: str) -> list[str]:
      """Hledá blok ```json ...``` s klíčem 'phases'. Vrátí seznam názvů fází."""
-     m = re.search(r"```json\s*(\{.*?\})\s*```", text, flags=re.S)
+     m = _JSON_RE.search(text)
      if not m:
          return []
      try:
@@ -222,32 +478,37 @@ def _extract_phases_from_json_block(text: str) -> list[str]:
 
 def _first_bullets_as_phases(markdown_text: str, max_items: int = 12) -> list[str]:
      """Záložní metoda: vezmi první seznam odstavců pod '## Přehled fází'."""
-     block = re.split(r"^##\s+Přehled fází.*?$", markdown_text, maxsplit=1, flags=re.I|re.M)
+     block = _PHASE_HDR.split(markdown_text, maxsplit=1)
      if len(block) < 2:
          return []
      after = block[1]
-     items = re.findall(r"^\s*[-*]\s*(.+)$", after, flags=re.M)
+     items = _BULLET.findall(after)
      # odstraň případný popis za pomlčkou
-     return [re.sub(r"\s*[–-]\s*.*$", "", it).strip() for it in items][:max_items]
+     return [_TRAIL.sub("", it).strip() for it in items[:max_items]]
 
-async def process_inputs_and_generate(input_dir: Path, output_dir: Path, audience: str, style: str) -> Dict[str, str]:
-    corpus = _collect_corpus(input_dir)
-    attachments = _list_attachments(input_dir)
+def _extract_phases(text: str) -> list[str]:
+     """Fáze pro schéma: nejdřív z bloku ```json```, jinak z odrážek pod '## Přehled fází'."""
+     return _extract_phases_from_json_block(text) or _first_bullets_as_phases(text)
+
+async def process_inputs_and_generate(sources: list[Source], output_dir: Path, audience: str, style: str) -> Dict[str, str]:
+    corpus = await _collect_corpus(sources)
+    attachments = _list_attachments(sources)
     prompt = _build_prompt(corpus, audience, style, attachments)
     text = await _call_llm(prompt)
     text = _strip_meta(text)
 
     # Získat fáze pro schéma
-    phases = _extract_phases_from_json_block(text)
-    if not phases:
-        phases = _first_bullets_as_phases(text)
+    phases = _extract_phases(text)
     if not phases:
         phases = ["Příprava", "Zpracování", "Schválení", "Realizace", "Uzavření"]  # nouzová výplň
 
 
-    docx_path = output_dir / "vystup_navod.docx"
-    _make_docx(text, docx_path)
-    png_path = _make_png_from_phases(output_dir, phases)
-    audio_path = _make_tts(text, output_dir / "shrnutí.mp3")
+    # výstupy na sobě nezávisí – docx, schéma i TTS běží souběžně ve vláknech
+    docx_path = output_dir / DOCX_FILENAME
+    _, png_path, audio_path = await asyncio.gather(
+        asyncio.to_thread(_make_docx, text, docx_path),
+        asyncio.to_thread(_make_png_from_phases, output_dir, phases),
+        asyncio.to_thread(_make_tts, text, output_dir / AUDIO_FILENAME),
+    )
 
     return {"docx": str(docx_path), "png": str(png_path), "audio": audio_path}